@@ -7,7 +7,7 @@
 
 import pigpio
 import time
-import struct
+import numpy as np
 from typing import Tuple
 
 class MPU6050:
@@ -32,7 +32,16 @@ class MPU6050:
     ACCEL_YOUT_L    = 0x3E
     ACCEL_ZOUT_H    = 0x3F
     ACCEL_ZOUT_L    = 0x40
+    INT_STATUS      = 0x3A
+    USER_CTRL       = 0x6A
     PWR_MGMT_1      = 0x6B
+    FIFO_EN         = 0x23
+    FIFO_COUNT_H    = 0x72
+    FIFO_COUNT_L    = 0x73
+    FIFO_R_W        = 0x74
+
+    # Size of the on-chip FIFO in bytes
+    FIFO_SIZE       = 1024
 
     # Constants to calculate and calibrate acceleration
     RES             = 1 / 16384 # [g], LSB
@@ -41,6 +50,18 @@ class MPU6050:
     N_CAL           = 50        # Times to get calibration data
     T_CAL           = 0.005     # Interval to get calibration data
 
+    # Precomputed unit coefficients, looked up by dict instead of an
+    # if/elif chain on the latency-critical measurement path
+    _COEFF = {
+        'g':      RES,
+        'gal':    RES * G2GAL,
+        'm/s**2': RES * G2MPSSQ,
+        'raw':    1.0,
+    }
+
+    # Fixed attribute set, skips per-instance __dict__ lookup
+    __slots__ = ('_pi', '_h', 'DLPF_CFG', '_ofs', '_reg_ptr')
+
     # Constructor
     def __init__(self, pi: pigpio.pi, bus: int = I2C_BUS, addr: int = I2C_ADDR) -> None:
         # Open I2C bus and get handle
@@ -57,10 +78,14 @@ class MPU6050:
         # Initialize digital low-pass filter setting
         self.DLPF_CFG = 0
 
-        # Initialize offsets
-        self._ofsx = 0
-        self._ofsy = 0
-        self._ofsz = 0
+        # Initialize offsets, kept as a vector for vectorized subtraction
+        self._ofs = np.zeros(3, dtype = np.int32)
+
+        # Track where the device register pointer is parked, -1 when unknown.
+        # Reads of FIFO_R_W do not advance the pointer, so consecutive FIFO
+        # drains can skip re-addressing; any other traffic invalidates it
+        # because data-register bursts auto-increment past the read window.
+        self._reg_ptr = -1
 
     # Destructor
     def __del__(self) -> None:
@@ -72,6 +97,7 @@ class MPU6050:
         d = self._pi.i2c_read_byte_data(self._h, MPU6050.PWR_MGMT_1)
         d &= 0b101111
         self._pi.i2c_write_byte_data(self._h, MPU6050.PWR_MGMT_1, d)
+        self._reg_ptr = -1
 
     # Set digital low-pass filter
     def setDLPF(self, cfg: int) -> None:
@@ -82,93 +108,173 @@ class MPU6050:
             d &= 0b11111000
             d |= self.DLPF_CFG
             self._pi.i2c_write_byte_data(self._h, MPU6050.CONFIG, d)
+            self._reg_ptr = -1
         else:
             raise ValueError('Invalid digital LPF setting (DLPG_CFG) value')
 
+    # Set sample rate divider
+    # Output rate is 1 kHz / (1 + div) when the digital LPF is enabled
+    def setSMPLRTDiv(self, div: int) -> None:
+        if 0 <= div <= 255:
+            self._pi.i2c_write_byte_data(self._h, MPU6050.SMPLRT_DIV, div)
+            self._reg_ptr = -1
+        else:
+            raise ValueError('Invalid sample rate divider (SMPLRT_DIV) value')
+
+    # Enable on-chip FIFO buffering of accelerometer samples
+    # The FIFO is reset first so that no stale samples remain
+    def enableFIFO(self) -> None:
+        # Read, modify FIFO bits in USER_CTRL, write back.
+        # FIFO_RESET only takes effect while FIFO_EN is low, so disable
+        # first, reset, then re-enable
+        d = self._pi.i2c_read_byte_data(self._h, MPU6050.USER_CTRL)
+        d &= 0b10111111
+        self._pi.i2c_write_byte_data(self._h, MPU6050.USER_CTRL, d)                 # FIFO_EN off
+        self._pi.i2c_write_byte_data(self._h, MPU6050.USER_CTRL, d | 0b00000100)    # FIFO_RESET
+        self._pi.i2c_write_byte_data(self._h, MPU6050.USER_CTRL, d | 0b01000000)    # FIFO_EN
+
+        # Read, modify only bit 3, write back, route accelerometer to FIFO
+        d = self._pi.i2c_read_byte_data(self._h, MPU6050.FIFO_EN)
+        self._pi.i2c_write_byte_data(self._h, MPU6050.FIFO_EN, d | 0b00001000)      # ACCEL_FIFO_EN
+
+        # Reading INT_STATUS clears an overflow latched while the FIFO was
+        # filling unattended, which would otherwise fail the first readFIFO
+        self._pi.i2c_read_byte_data(self._h, MPU6050.INT_STATUS)
+        self._reg_ptr = -1
+
+    # Disable on-chip FIFO buffering, for when nobody drains the FIFO
+    # Left enabled, it overflows within seconds and latches FIFO_OFLOW_INT
+    def disableFIFO(self) -> None:
+        # Read, modify only bit 3, write back, stop accelerometer writes
+        d = self._pi.i2c_read_byte_data(self._h, MPU6050.FIFO_EN)
+        self._pi.i2c_write_byte_data(self._h, MPU6050.FIFO_EN, d & 0b11110111)
+
+        # Read, modify only bit 6, write back, switch the FIFO off
+        d = self._pi.i2c_read_byte_data(self._h, MPU6050.USER_CTRL)
+        self._pi.i2c_write_byte_data(self._h, MPU6050.USER_CTRL, d & 0b10111111)
+        self._reg_ptr = -1
+
+    # Get number of bytes currently buffered in the FIFO
+    def countFIFO(self) -> int:
+        (b, d) = self._pi.i2c_read_i2c_block_data(self._h, MPU6050.FIFO_COUNT_H, 2)
+
+        if b <= 0:
+            raise Exception(f'Data acquisition from device on I2C bus {MPU6050.I2C_BUS}, address {MPU6050.I2C_ADDR:#02x} failed')
+
+        # The pointer auto-incremented past FIFO_COUNT_L, i.e. onto FIFO_R_W
+        self._reg_ptr = MPU6050.FIFO_R_W
+
+        return (d[0] << 8) | d[1]
+
+    # Read n raw samples from the FIFO in a single I2C transaction
+    # Caller must drain often enough that n * 6 bytes never exceed FIFO_SIZE,
+    # or samples are lost to FIFO overflow
+    def readFIFO(self, n: int) -> np.ndarray:
+        if n * 6 > MPU6050.FIFO_SIZE:
+            raise ValueError('Requested more samples than the FIFO can hold')
+
+        # A FIFO overflow means samples were lost and the byte stream may no
+        # longer be aligned on sample boundaries; reading FIFO_OFLOW_INT in
+        # INT_STATUS also clears it
+        d = self._pi.i2c_read_byte_data(self._h, MPU6050.INT_STATUS)
+        self._reg_ptr = -1
+        if d & 0b00010000:
+            raise Exception(f'FIFO overflow on device on I2C bus {MPU6050.I2C_BUS}, address {MPU6050.I2C_ADDR:#02x}, samples lost')
+
+        # Wait until n complete samples are buffered, the sensor paces sampling
+        count = self.countFIFO()
+        while count < n * 6:
+            time.sleep(0.001)
+            count = self.countFIFO()
+
+        # Park the register pointer at FIFO_R_W unless it is already there,
+        # then drain in one transaction; FIFO reads leave the pointer in place
+        if self._reg_ptr != MPU6050.FIFO_R_W:
+            self._pi.i2c_write_byte(self._h, MPU6050.FIFO_R_W)
+            self._reg_ptr = MPU6050.FIFO_R_W
+        (b, d) = self._pi.i2c_read_device(self._h, n * 6)
+
+        if b <= 0:
+            raise Exception(f'Data acquisition from device on I2C bus {MPU6050.I2C_BUS}, address {MPU6050.I2C_ADDR:#02x} failed')
+
+        # The sensor samples on its own ~1%-accurate oscillator while the
+        # caller's drain cadence follows the host clock; if the sensor runs
+        # fast, the difference accumulates in the FIFO and would eventually
+        # overflow it. Discard any whole surplus samples beyond the n just
+        # read so the backlog stays bounded.
+        surplus = (count - n * 6) // 6 * 6
+        if surplus > 0:
+            self._pi.i2c_read_device(self._h, surplus)
+
+        return np.frombuffer(bytes(d), dtype = '>i2').reshape(-1, 3)
+
     # Measure acceleration
     def measureAccel(self, unit: str = 'g') -> Tuple[float, float, float]:
         # Read from DATAX0 to DATAZ1
         (b, d) = self._pi.i2c_read_i2c_block_data(self._h, MPU6050.ACCEL_XOUT_H, 6)
 
+        self._reg_ptr = -1
+
         if MPU6050.DEBUG:
             print(f'Bytes read: {b}')
             print(f'Raw data: {d}')
 
-        # Unpack data
+        # Unpack data as a big-endian int16 view and subtract software offsets
         if b > 0:
-            (x_raw, y_raw, z_raw) = struct.unpack('>3h', d)
+            raw = np.frombuffer(bytes(d), dtype = '>i2').astype(np.int32) - self._ofs
         else:
             raise Exception(f'Data acquisition from device on I2C bus {MPU6050.I2C_BUS}, address {MPU6050.I2C_ADDR:#02x} failed')
-            (x_raw, y_raw, z_raw) = (0, 0, 0)
-
-        # Subtract software offsets
-        x_raw -= self._ofsx
-        y_raw -= self._ofsy
-        z_raw -= self._ofsz
 
         # Calculate and return acceleration in specified unit and return
-        if unit == 'g':
-            coeff = MPU6050.RES
-        elif unit == 'gal':
-            coeff = MPU6050.RES * MPU6050.G2GAL
-        elif unit == 'm/s**2':
-            coeff = MPU6050.RES * MPU6050.G2MPSSQ
-        elif unit == 'raw':
-            coeff = 1.0
-        else:
+        try:
+            coeff = MPU6050._COEFF[unit]
+        except KeyError:
             raise ValueError('No such unit supported')
 
-        return (x_raw * coeff, y_raw * coeff, z_raw * coeff)
+        return tuple(raw * coeff)
+
+    # Get offset setting values
+    def getofs(self) -> Tuple[int, int, int]:
+        return tuple(self._ofs.tolist())
 
     # Clear offset setting values
     def clearofs(self) -> None:
-        self._ofsx = 0
-        self._ofsy = 0
-        self._ofsz = 0
+        self._ofs[:] = 0
 
     # Perform offset calibration, by software
     def calofs(self, gravity: str = 'z+') -> None:
         # Clear offset registers
         self.clearofs()
 
-        # Measure T_CAL times and take average
-        x_ave = 0
-        y_ave = 0
-        z_ave = 0
-        for _ in range(MPU6050.N_CAL):
-            (x, y, z) = self.measureAccel(unit = 'raw')
-            x_ave += x
-            y_ave += y
-            z_ave += z
+        # Measure N_CAL times and take average as a single NumPy reduction
+        samples = np.empty((MPU6050.N_CAL, 3), dtype = np.int16)
+        for k in range(MPU6050.N_CAL):
+            samples[k,:] = self.measureAccel(unit = 'raw')
             time.sleep(MPU6050.T_CAL)
-        x_ave /= MPU6050.N_CAL
-        y_ave /= MPU6050.N_CAL
-        z_ave /= MPU6050.N_CAL
+        ave = samples.mean(axis = 0)
 
         if MPU6050.DEBUG:
             print('Averages:')
-            print(f'X: {x_ave}, Y: {y_ave}, Z: {z_ave}')
+            print(f'X: {ave[0]}, Y: {ave[1]}, Z: {ave[2]}')
 
         # Gravity
         one_g = int(1.0 / MPU6050.RES)
 
-        self._ofsx = int(x_ave)
-        self._ofsy = int(y_ave)
-        self._ofsz = int(z_ave)
+        self._ofs[:] = ave.astype(np.int32)
 
         # Add or subtract 1 g to offset
         if gravity == 'x+':
-            self._ofsx -= one_g
+            self._ofs[0] -= one_g
         elif gravity == 'x-':
-            self._ofsx += one_g
+            self._ofs[0] += one_g
         if gravity == 'y+':
-            self._ofsy -= one_g
+            self._ofs[1] -= one_g
         elif gravity == 'y-':
-            self._ofsy += one_g
+            self._ofs[1] += one_g
         elif gravity == 'z+':
-            self._ofsz -= one_g
+            self._ofs[2] -= one_g
         elif gravity == 'z-':
-            self._ofsz += one_g
+            self._ofs[2] += one_g
         elif gravity == 'free':
             pass
         else: